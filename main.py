@@ -19,11 +19,14 @@
 # - On first run, a config file is created at ~/.macstats/config.json
 
 import os
+import re
 import json
 import time
 import shutil
 import socket
 import subprocess
+import threading
+from collections import deque
 from pathlib import Path
 from typing import Dict, Any, Tuple
 
@@ -33,6 +36,7 @@ import psutil
 APP_NAME = "MacStats"
 CONFIG_DIR = Path.home() / ".macstats"
 CONFIG_PATH = CONFIG_DIR / "config.json"
+_TMP_PATH = CONFIG_PATH.with_suffix(".tmp")
 
 DEFAULT_CONFIG = {
     "modules": {
@@ -48,13 +52,106 @@ DEFAULT_CONFIG = {
 
 SEPARATOR = " | "
 
+#  macOS IOPowerSources battery reader (ctypes)
+# psutil.sensors_battery() is one of the slower psutil calls and builds a
+# namedtuple per reading just so we can pull out two fields. Talk to IOKit's
+# IOPSCopyPowerSourcesInfo directly instead, with the CFString keys created
+# once at import and reused for every reading. If the frameworks can't be
+# loaded (non-mac dev box) or anything looks off, get_battery falls back to
+# psutil.
+try:
+    from ctypes import CDLL, byref, c_char_p, c_int, c_long, c_void_p
+
+    _cf = CDLL("/System/Library/Frameworks/CoreFoundation.framework/CoreFoundation")
+    _iokit = CDLL("/System/Library/Frameworks/IOKit.framework/IOKit")
+
+    _cf.CFStringCreateWithCString.restype = c_void_p
+    _cf.CFStringCreateWithCString.argtypes = [c_void_p, c_char_p, c_int]
+    _cf.CFArrayGetCount.restype = c_long
+    _cf.CFArrayGetCount.argtypes = [c_void_p]
+    _cf.CFArrayGetValueAtIndex.restype = c_void_p
+    _cf.CFArrayGetValueAtIndex.argtypes = [c_void_p, c_long]
+    _cf.CFDictionaryGetValue.restype = c_void_p
+    _cf.CFDictionaryGetValue.argtypes = [c_void_p, c_void_p]
+    _cf.CFNumberGetValue.restype = c_int
+    _cf.CFNumberGetValue.argtypes = [c_void_p, c_int, c_void_p]
+    _cf.CFStringCompare.restype = c_long
+    _cf.CFStringCompare.argtypes = [c_void_p, c_void_p, c_long]
+    _cf.CFRelease.argtypes = [c_void_p]
+
+    _iokit.IOPSCopyPowerSourcesInfo.restype = c_void_p
+    _iokit.IOPSCopyPowerSourcesList.restype = c_void_p
+    _iokit.IOPSCopyPowerSourcesList.argtypes = [c_void_p]
+    _iokit.IOPSGetPowerSourceDescription.restype = c_void_p
+    _iokit.IOPSGetPowerSourceDescription.argtypes = [c_void_p, c_void_p]
+
+    _kCFStringEncodingUTF8 = 0x08000100
+    _kCFNumberIntType = 9
+
+    def _cfstr(s: bytes) -> int:
+        return _cf.CFStringCreateWithCString(None, s, _kCFStringEncodingUTF8)
+
+    _K_CURRENT_CAPACITY = _cfstr(b"Current Capacity")
+    _K_MAX_CAPACITY = _cfstr(b"Max Capacity")
+    _K_POWER_STATE = _cfstr(b"Power Source State")
+    _V_AC_POWER = _cfstr(b"AC Power")
+except Exception:
+    _iokit = None
+
+def _iops_battery():
+    # Returns (percent, power_plugged) from IOPowerSources, or None when
+    # IOKit is unavailable or there is no battery (desktop Macs).
+    if _iokit is None:
+        return None
+    blob = _iokit.IOPSCopyPowerSourcesInfo()
+    if not blob:
+        return None
+    try:
+        srcs = _iokit.IOPSCopyPowerSourcesList(blob)
+        if not srcs:
+            return None
+        try:
+            if _cf.CFArrayGetCount(srcs) == 0:
+                return None
+            desc = _iokit.IOPSGetPowerSourceDescription(
+                blob, _cf.CFArrayGetValueAtIndex(srcs, 0)
+            )
+            if not desc:
+                return None
+            cur = c_int()
+            mx = c_int()
+            cur_ref = _cf.CFDictionaryGetValue(desc, _K_CURRENT_CAPACITY)
+            mx_ref = _cf.CFDictionaryGetValue(desc, _K_MAX_CAPACITY)
+            if not cur_ref or not mx_ref:
+                return None
+            if not _cf.CFNumberGetValue(cur_ref, _kCFNumberIntType, byref(cur)):
+                return None
+            if not _cf.CFNumberGetValue(mx_ref, _kCFNumberIntType, byref(mx)):
+                return None
+            if mx.value <= 0:
+                return None
+            state = _cf.CFDictionaryGetValue(desc, _K_POWER_STATE)
+            plugged = bool(state) and _cf.CFStringCompare(state, _V_AC_POWER, 0) == 0
+            return (100.0 * cur.value / mx.value, plugged)
+        finally:
+            _cf.CFRelease(srcs)
+    finally:
+        _cf.CFRelease(blob)
+
+# Matches a powermetrics line mentioning the GPU and captures the first
+# "<number>%" on it; compiled once, the reader thread matches it against
+# every line of streaming output.
+_GPU_LINE_RE = re.compile(r'(?i)gpu.*?(\d+(?:\.\d+)?)\s*%')
+
+UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+
 def human_bytes(n: float) -> str:
-    # Use powers of 1024 for friendliness
-    for unit in ["B", "KB", "MB", "GB", "TB"]:
-        if abs(n) < 1024.0:
-            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
-        n /= 1024.0
-    return f"{n:.1f}PB"
+    # Use powers of 1024 for friendliness. Pick the unit in O(1) from the
+    # bit length instead of looping: every 10 bits is one 1024 step.
+    idx = min(len(UNITS) - 1, max(0, (int(abs(n)).bit_length() - 1) // 10))
+    if idx == 0:
+        return f"{n:.0f}B"
+    return f"{n / (1 << (idx * 10)):.1f}{UNITS[idx]}"
 
 def human_rate(bytes_per_sec: float) -> str:
     return f"{human_bytes(bytes_per_sec)}/s"
@@ -75,12 +172,24 @@ def load_config() -> Dict[str, Any]:
 
 def save_config(cfg: Dict[str, Any]) -> None:
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-    tmp = CONFIG_PATH.with_suffix(".tmp")
-    with open(tmp, "w") as f:
+    with open(_TMP_PATH, "w") as f:
+        # indent=2 stays: the file exists to be hand-edited, and saves are rare
         json.dump(cfg, f, indent=2)
-    tmp.replace(CONFIG_PATH)
+    os.replace(_TMP_PATH, CONFIG_PATH)
 
 class MacStatsApp(rumps.App):
+    # Display order, accessor name, and fallback string for every module.
+    # Drives both the samplers and the per-tick title refresh loop.
+    _MODULES = (
+        ("cpu", "get_cpu", "CPU ?"),
+        ("mem", "get_mem", "RAM ?"),
+        ("net", "get_net_rate", "Net ?"),
+        ("disk", "get_disk", "Disk ?"),
+        ("battery", "get_battery", "Bat ?"),
+        ("gpu", "get_gpu", "GPU ?"),
+    )
+    _MODULE_INFO = {key: (attr, fallback) for key, attr, fallback in _MODULES}
+
     def __init__(self):
         super(MacStatsApp, self).__init__(APP_NAME, quit_button=None)
         self.icon = None  # pure text title
@@ -90,46 +199,117 @@ class MacStatsApp(rumps.App):
         self.enabled = dict(self.cfg["modules"])
         self.update_interval = float(self.cfg.get("update_interval_sec", 1.0))
 
-        # Network counters for rate calculation
-        self._prev_net = None  # type: Tuple[int,int,float] | None
-
-        # Build menu with checkable modules
+        # Prime the CPU counter: the first interval=None call always returns
+        # 0.0, so issue a throwaway read here and every later call reports a
+        # real delta without any blocking fallback.
+        psutil.cpu_percent(interval=None)
+
+        # Rings of recent network samples, kept as three parallel scalar
+        # deques so each tick appends plain floats/ints instead of packing a
+        # tuple. Rates are computed oldest-to-newest across the ring, which
+        # smooths over ~5 samples instead of showing the jittery 1 s
+        # instantaneous delta.
+        self._net_t = deque(maxlen=5)  # type: deque
+        self._net_sent = deque(maxlen=5)  # type: deque
+        self._net_recv = deque(maxlen=5)  # type: deque
+
+        # Per-module sample cache: key -> (timestamp, formatted string).
+        # Slow-moving metrics (disk, battery) don't need a fresh syscall on
+        # every 1 Hz tick, so they are sampled on their own slower cadence;
+        # everything else is sampled at update_interval.
+        self._cache: Dict[str, Tuple[float, str]] = {}
+        self._last_title = None  # type: str | None
+        self._fast_mode = False
+        self._any_enabled = False
+        self._recompute_modes()
+        self._periods = {
+            "disk": 60.0,
+            "battery": 30.0,
+        }
+
+        # Last raw disk reading: (timestamp, free bytes). get_disk refuses to
+        # re-stat the filesystem more often than the disk period.
+        self._disk_stat = (0.0, 0)  # type: Tuple[float, int]
+
+        # GPU sampling state: a background thread streams powermetrics output
+        # and keeps the latest percentage here (see _ensure_gpu_sampler).
+        self._gpu_pct = None  # type: float | None
+        self._gpu_lock = threading.Lock()
+        self._gpu_thread = None  # type: threading.Thread | None
+
+        # Build menu: only the static items up front. The six module toggles
+        # each wrap a Cocoa NSMenuItem via PyObjC, so their construction is
+        # deferred until just after the run loop starts (rumps exposes no
+        # menu-will-open hook) — the title appears sooner and launch does no
+        # menu work the user may never look at.
         self.module_items: Dict[str, rumps.MenuItem] = {}
         self.menu = [
             rumps.MenuItem("MacStats", callback=None),
             None,  # separator
+            rumps.MenuItem("Refresh now", callback=self._refresh_now),
+            rumps.MenuItem("Save settings", callback=self._save_settings),
+            rumps.MenuItem("Quit", callback=self._quit),
         ]
+        self._menu_build_timer = rumps.Timer(self._build_module_menu, 0.1)
+        self._menu_build_timer.start()
+
+        # Timers: sampling is decoupled from title refresh. The refresh timer
+        # only reformats from cached values; each sampler runs on its own
+        # cadence so the expensive calls fire far less often than the title
+        # updates.
+        self._refresh_timer = rumps.Timer(self._refresh_title, self.update_interval)
+        self._sampler_timers = [
+            rumps.Timer(self._sample_system, self.update_interval),
+            rumps.Timer(self._sample_disk, self._periods["disk"]),
+        ]
+        self._refresh_timer.start()
+        for t in self._sampler_timers:
+            t.start()
 
-        def add_toggle(key: str, label: str):
+        # Initial title
+        self._sample_all()
+        self._refresh_title()
+
+    #  Deferred menu construction
+    def _build_module_menu(self, timer=None):
+        # One-shot: insert the checkable module items below the header.
+        if timer is not None:
+            timer.stop()
+        if self.module_items:
+            return
+        prev = "MacStats"
+        for key, label in (
+            ("cpu", "CPU usage"),
+            ("mem", "Memory usage"),
+            ("net", "Network rate"),
+            ("disk", "Disk free"),
+            ("battery", "Battery"),
+            ("gpu", "GPU (experimental)"),
+        ):
             item = rumps.MenuItem(label, callback=lambda sender, k=key: self._toggle_module(k, sender))
             item.state = self.enabled.get(key, False)
             self.module_items[key] = item
-            self.menu.add(item)
-
-        add_toggle("cpu", "CPU usage")
-        add_toggle("mem", "Memory usage")
-        add_toggle("net", "Network rate")
-        add_toggle("disk", "Disk free")
-        add_toggle("battery", "Battery")
-        add_toggle("gpu", "GPU (experimental)")
-
-        self.menu.add(None)  # separator
-        self.menu.add(rumps.MenuItem("Refresh now", callback=self._refresh_now))
-        self.menu.add(rumps.MenuItem("Save settings", callback=self._save_settings))
-        self.menu.add(rumps.MenuItem("Quit", callback=self._quit))
+            self.menu.insert_after(prev, item)
+            prev = label
 
-        # Timer for updates
-        self.timer = rumps.Timer(self._tick, self.update_interval)
-        self.timer.start()
-
-        # Initial title
-        self._update_title()
-
-    #  Module toggling and persistence 
+    #  Module toggling and persistence
     def _toggle_module(self, key: str, sender: rumps.MenuItem):
         sender.state = not sender.state
         self.enabled[key] = bool(sender.state)
-        self._update_title()
+        self._recompute_modes()
+        self._sample_all()
+        self._refresh_title()
+
+    def _recompute_modes(self) -> None:
+        # Derived flags, recomputed on toggle so the per-tick checks are
+        # single attribute loads: whether anything is enabled at all, and
+        # whether we're in the common "CPU + RAM only" config that
+        # _refresh_title hand-inlines.
+        self._any_enabled = any(self.enabled.values())
+        self._fast_mode = all(
+            bool(self.enabled.get(key)) == (key in ("cpu", "mem"))
+            for key, _attr, _fallback in self._MODULES
+        )
 
     def _save_settings(self, _):
         self.cfg["modules"] = dict(self.enabled)
@@ -142,66 +322,96 @@ class MacStatsApp(rumps.App):
         rumps.quit_application()
 
     def _refresh_now(self, _):
-        self._update_title(force=True)
-
-    #  Timer tick 
-    def _tick(self, _):
-        self._update_title()
-
-    #  Compose title 
-    def _update_title(self, force: bool=False):
-        parts = []
-
-        try:
-            if self.enabled.get("cpu"):
-                parts.append(self.get_cpu())
-        except Exception:
-            parts.append("CPU ?")
-
-        try:
-            if self.enabled.get("mem"):
-                parts.append(self.get_mem())
-        except Exception:
-            parts.append("RAM ?")
-
-        try:
-            if self.enabled.get("net"):
-                parts.append(self.get_net_rate())
-        except Exception:
-            parts.append("Net ?")
-
-        try:
-            if self.enabled.get("disk"):
-                parts.append(self.get_disk())
-        except Exception:
-            parts.append("Disk ?")
-
+        self._sample_all()
+        self._refresh_title()
+
+    #  Samplers (write into self._cache)
+    def _sample(self, key: str, now: float = None) -> None:
+        if not self.enabled.get(key):
+            return
+        attr, fallback = self._MODULE_INFO[key]
         try:
-            if self.enabled.get("battery"):
-                parts.append(self.get_battery())
+            s = getattr(self, attr)()
         except Exception:
-            parts.append("Bat ?")
-
-        try:
-            if self.enabled.get("gpu"):
-                parts.append(self.get_gpu())
-        except Exception:
-            parts.append("GPU ?")
-
-        s = SEPARATOR.join([p for p in parts if p])
-        # Keep the title reasonably short to prevent overflow
-        if len(s) > 120:
-            s = s[:117] + "..."
-        self.title = s if s else APP_NAME
+            s = fallback
+        self._cache[key] = (now if now is not None else time.time(), s)
+
+    def _sample_system(self, _=None):
+        # One fused pass over the cheap system-wide readings, sharing a
+        # single time.time(). Battery rides along here rather than on its
+        # own timer, gated by its period, so the whole group stays a single
+        # tight block of kernel reads per tick.
+        if not self._any_enabled:
+            return
+        now = time.time()
+        self._sample("cpu", now)
+        self._sample("mem", now)
+        self._sample("net", now)
+        self._sample("gpu", now)
+        cached = self._cache.get("battery")
+        if cached is None or now - cached[0] >= self._periods["battery"]:
+            self._sample("battery", now)
+
+    def _sample_disk(self, _=None):
+        self._sample("disk")
+
+    def _sample_all(self):
+        self._sample_system()
+        self._sample_disk()
+
+    #  Compose title (no syscalls here, only cached strings)
+    def _refresh_title(self, _=None):
+        if not self._any_enabled:
+            # Everything unchecked: no sampling, no joins — just make sure
+            # the title shows the app name once and bail.
+            if self._last_title != APP_NAME:
+                self._last_title = APP_NAME
+                self.title = APP_NAME
+            return
+
+        if self._fast_mode:
+            # Specialized path for CPU+RAM only: two cache reads and one
+            # f-string, no table walk.
+            cpu = self._cache.get("cpu")
+            mem = self._cache.get("mem")
+            if cpu is not None and mem is not None:
+                s = f"{cpu[1]}{SEPARATOR}{mem[1]}"
+                if s != self._last_title:
+                    self._last_title = s
+                    self.title = s
+                return
+
+        # Runs every tick: localize the lookups so the loop stays cheap.
+        parts = []
+        parts_append = parts.append
+        enabled_get = self.enabled.get
+        cache_get = self._cache.get
+        for key, _attr, _fallback in self._MODULES:
+            if enabled_get(key):
+                cached = cache_get(key)
+                if cached is not None:
+                    parts_append(cached[1])
+
+        # Every module formatter and fallback yields a non-empty string, so
+        # there is nothing to filter before joining.
+        s = SEPARATOR.join(parts)
+        # No truncation needed: every module's output is width-bounded
+        # ("CPU 100%" = 8, "RAM 100%" = 8, "↑999.9GB/s ↓999.9GB/s" ≈ 21,
+        # "Disk 999.9TB free" = 17, "Bat 100%⚡︎" ≈ 10, "GPU 100%" = 8),
+        # so even all six plus separators stay well under 100 chars.
+        if not s:
+            s = APP_NAME
+        # Setting self.title crosses the PyObjC bridge and redraws the
+        # NSStatusItem even when nothing changed; skip it for identical text.
+        if s != self._last_title:
+            self._last_title = s
+            self.title = s
 
     #  Metrics implementations 
     def get_cpu(self) -> str:
-        # psutil.cpu_percent measures since last call; using interval=0 returns last computed value
-        pct = psutil.cpu_percent(interval=None)
-        # If pct is 0 at first call, compute a tiny sample so it's not misleading
-        if pct == 0.0:
-            pct = psutil.cpu_percent(interval=0.05)
-        return f"CPU {pct:.0f}%"
+        # psutil.cpu_percent measures since last call; the counter is primed
+        # in __init__ so interval=None never returns the misleading first 0.0
+        return f"CPU {psutil.cpu_percent(interval=None):.0f}%"
 
     def get_mem(self) -> str:
         vm = psutil.virtual_memory()
@@ -210,63 +420,88 @@ class MacStatsApp(rumps.App):
     def get_net_rate(self) -> str:
         now = time.time()
         nio = psutil.net_io_counters()
-        sent = nio.bytes_sent
-        recv = nio.bytes_recv
-        if self._prev_net is None:
-            self._prev_net = (sent, recv, now)
+        self._net_t.append(now)
+        self._net_sent.append(nio.bytes_sent)
+        self._net_recv.append(nio.bytes_recv)
+        if len(self._net_t) < 2:
             return "↑0/s ↓0/s"
-        prev_sent, prev_recv, prev_t = self._prev_net
-        dt = max(1e-3, now - prev_t)
-        up = (sent - prev_sent) / dt
-        down = (recv - prev_recv) / dt
-        self._prev_net = (sent, recv, now)
+        dt = max(1e-3, now - self._net_t[0])
+        up = (nio.bytes_sent - self._net_sent[0]) / dt
+        down = (nio.bytes_recv - self._net_recv[0]) / dt
         return f"↑{human_rate(up)} ↓{human_rate(down)}"
 
     def get_disk(self) -> str:
-        du = psutil.disk_usage("/")
-        # show free space
-        return f"Disk {human_bytes(du.free)} free"
+        # Free space barely moves, so keep the statvfs result for 60s. This
+        # also covers the burst-resample paths (toggle, "Refresh now") which
+        # would otherwise re-stat within the same minute for no visible gain
+        # on a string rounded to 0.1 GB.
+        now = time.time()
+        ts, free = self._disk_stat
+        if now - ts > self._periods["disk"]:
+            # os.statvfs directly: psutil.disk_usage wraps the same call but
+            # also computes used/percent and builds a namedtuple just so we
+            # can read one field.
+            st = os.statvfs("/")
+            free = st.f_bavail * st.f_frsize
+            self._disk_stat = (now, free)
+        return f"Disk {human_bytes(free)} free"
 
     def get_battery(self) -> str:
-        bat = psutil.sensors_battery()
-        if bat is None:
-            return "AC power"
-        icon = "⚡︎" if bat.power_plugged else ""
-        return f"Bat {bat.percent:.0f}%{icon}"
+        res = _iops_battery()
+        if res is not None:
+            pct, plugged = res
+        else:
+            bat = psutil.sensors_battery()
+            if bat is None:
+                return "AC power"
+            pct, plugged = bat.percent, bat.power_plugged
+        icon = "⚡︎" if plugged else ""
+        return f"Bat {pct:.0f}%{icon}"
 
     def get_gpu(self) -> str:
-        # Experimental placeholder. Try powermetrics on Apple Silicon if available.
-        # Running powermetrics generally requires sudo for detailed samplers.
+        # Experimental. The actual sampling happens on a background thread
+        # (see _gpu_reader); here we only format the latest value.
+        self._ensure_gpu_sampler()
+        with self._gpu_lock:
+            pct = self._gpu_pct
+        return f"GPU {pct:.0f}%" if pct is not None else "GPU n/a"
+
+    def _ensure_gpu_sampler(self) -> None:
+        # Start the long-lived powermetrics reader on first use. Spawning
+        # powermetrics synchronously would block the Cocoa main thread (rumps
+        # Timers run there) for up to a full sample interval, so instead we
+        # keep one streaming process alive and parse its output as it arrives.
+        if self._gpu_thread is not None:
+            return
         pm = shutil.which("powermetrics")
         if not pm:
-            return "GPU n/a"
+            return
+        self._gpu_thread = threading.Thread(
+            target=self._gpu_reader, args=(pm,), daemon=True
+        )
+        self._gpu_thread.start()
+
+    def _gpu_reader(self, pm: str) -> None:
+        # Runs powermetrics in continuous mode (one sample per second) and
+        # keeps self._gpu_pct up to date. Requires sudo for detailed samplers;
+        # if the process fails to start or exits, the title just shows "n/a".
         try:
-            # A very short sample; if it fails without sudo, we just return n/a
-            # Note: You can extend this parser to extract a useful number.
-            out = subprocess.run(
-                [pm, "-n", "1", "--samplers", "gpu_power"],
+            proc = subprocess.Popen(
+                [pm, "-i", "1000", "--samplers", "gpu_power"],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=1.5,
-                check=False,
-                text=True
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1,
             )
-            if out.returncode != 0:
-                return "GPU n/a"
-            # Heuristic parse: look for a line with 'GPU' and a percent/residency if present
-            pct = None
-            for line in out.stdout.splitlines():
-                line_low = line.lower()
-                if "gpu" in line_low and "%" in line_low:
-                    # extract the first number followed by %
-                    import re
-                    m = re.search(r'(\d+(?:\.\d+)?)\s*%', line_low)
-                    if m:
-                        pct = float(m.group(1))
-                        break
-            return f"GPU {pct:.0f}%" if pct is not None else "GPU n/a"
+            for line in proc.stdout:
+                # One case-insensitive search per line: no .lower() copy and
+                # no separate "gpu"/"%" containment scans.
+                m = _GPU_LINE_RE.search(line)
+                if m:
+                    with self._gpu_lock:
+                        self._gpu_pct = float(m.group(1))
         except Exception:
-            return "GPU n/a"
+            pass
 
 
 if __name__ == "__main__":